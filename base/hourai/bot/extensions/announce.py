@@ -1,15 +1,24 @@
 import asyncio
 import discord
+import logging
 import random
 from hourai.bot import cogs
 from hourai.db import models
 from discord.ext import commands
+from sqlalchemy import select
+
+log = logging.getLogger(__name__)
+
+# Window to coalesce username lookups for leave messages into a single query.
+USERNAME_BATCH_WINDOW = 0.05
 
 
 class Announce(cogs.BaseCog):
 
     def __init__(self, bot):
         self.bot = bot
+        self._pending_usernames = {}
+        self._text_channel_ids = {}
 
     @commands.group(invoke_without_command=True)
     @commands.guild_only()
@@ -49,6 +58,18 @@ class Announce(cogs.BaseCog):
         config.channel_ids.append(ctx.channel.id)
         return True
 
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel):
+        self._text_channel_ids.pop(channel.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self._text_channel_ids.pop(channel.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self._text_channel_ids.pop(guild.id, None)
+
     @commands.Cog.listener()
     async def on_member_join(self, member):
         if not member.pending:
@@ -64,7 +85,7 @@ class Announce(cogs.BaseCog):
         if not announce_config.HasField('joins'):
             return
         if len(announce_config.joins.messages) > 0:
-            choices = list(announce_config.joins.messages)
+            choices = announce_config.joins.messages
         else:
             choices = [f'**{member.mention}** has joined the server.']
         await self.__make_announcement(member.guild, announce_config.joins,
@@ -79,19 +100,48 @@ class Announce(cogs.BaseCog):
         announce_config = guild.config.announce
         if not announce_config.HasField('leaves'):
             return
-        with self.bot.create_storage_session() as session:
-            latest_name = session.query(models.Username) \
-                .filter_by(user_id=user_id) \
-                .order_by(models.Username.timestamp.desc()) \
-                .first()
-            if latest_name is None:
-                return
-            if len(announce_config.leaves.messages) > 0:
-                choices = list(announce_config.leaves.messages)
-            else:
-                choices = [f'**{latest_name.name}** has left the server.']
-            await self.__make_announcement(guild, announce_config.leaves,
-                                           choices)
+        latest_name = await self.get_latest_username(user_id)
+        if latest_name is None:
+            return
+        if len(announce_config.leaves.messages) > 0:
+            choices = announce_config.leaves.messages
+        else:
+            choices = [f'**{latest_name}** has left the server.']
+        await self.__make_announcement(guild, announce_config.leaves, choices)
+
+    async def get_latest_username(self, user_id):
+        """|coro| Gets the most recent known username for a user, or None if
+        none are known. Lookups made within USERNAME_BATCH_WINDOW of each other
+        are coalesced into a single query.
+        """
+        if not self._pending_usernames:
+            self.bot.loop.call_later(USERNAME_BATCH_WINDOW,
+                                     self.__flush_username_lookups)
+        future = self._pending_usernames.get(user_id)
+        if future is None:
+            future = self.bot.loop.create_future()
+            self._pending_usernames[user_id] = future
+        return await asyncio.shield(future)
+
+    def __flush_username_lookups(self):
+        pending, self._pending_usernames = self._pending_usernames, {}
+        try:
+            with self.bot.create_storage_session() as session:
+                # Uses DISTINCT ON to select only the latest name per user.
+                query = select([models.Username.user_id,
+                                models.Username.name]) \
+                    .where(models.Username.user_id.in_(list(pending))) \
+                    .order_by(models.Username.user_id,
+                              models.Username.timestamp.desc()) \
+                    .distinct(models.Username.user_id)
+                names = session.execute(query).fetchall()
+            names = dict(names)
+        except Exception as error:
+            for future in pending.values():
+                future.set_exception(error)
+            return
+        for user_id, future in pending.items():
+            future.set_result(names.get(user_id))
 
     @commands.Cog.listener()
     async def on_member_ban(self, guild, user):
@@ -99,20 +149,21 @@ class Announce(cogs.BaseCog):
         if not announce_config.HasField('bans'):
             return
         if len(announce_config.bans.messages) > 0:
-            choices = list(announce_config.bans.messages)
+            choices = announce_config.bans.messages
         else:
             choices = [f'**{user.name}** has been banned.']
         await self.__make_announcement(guild, announce_config.bans, choices)
 
     @commands.Cog.listener()
     async def on_voice_state_update(self, member, before, after):
+        # Most voice state updates are mutes, deafens, etc. that do not change
+        # channels. Skip them before touching the config.
+        if before.channel == after.channel:
+            return
         announce_config = member.guild.config.announce
         if not announce_config.HasField('voice'):
             return
-        assert not (before.channel is None and after.channel is None)
-        if before.channel == after.channel:
-            return
-        elif before.channel is None:
+        if before.channel is None:
             choices = [f'**{member.display_name}** joined '
                        f'**{after.channel.name}**.']
         elif after.channel is None:
@@ -127,17 +178,32 @@ class Announce(cogs.BaseCog):
 
     async def __make_announcement(self, guild, config, choices):
         assert len(choices) > 0
-        channels = [guild.get_channel(ch_id) for ch_id in config.channel_ids]
-        channels = [ch for ch in channels
-                    if isinstance(ch, discord.TextChannel)]
-        tasks = []
-        for channel in channels:
-            content = random.choice(choices)
-            tasks.append(channel.send(content))
-        try:
-            await asyncio.gather(*tasks)
-        except discord.errors.Forbidden:
-            pass
+        channel_ids = self.__get_text_channel_ids(guild) \
+            .intersection(config.channel_ids)
+        channels = [guild.get_channel(ch_id) for ch_id in channel_ids]
+        channels = [ch for ch in channels if ch is not None]
+        if len(choices) == 1:
+            contents = [choices[0]] * len(channels)
+        else:
+            contents = random.choices(choices, k=len(channels))
+        tasks = [ch.send(content) for ch, content in zip(channels, contents)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for channel, result in zip(channels, results):
+            # Missing permissions in a channel are a misconfiguration on the
+            # guild's end, and should not block announcements elsewhere.
+            if isinstance(result, Exception) and \
+               not isinstance(result, discord.errors.Forbidden):
+                log.error(f'Failed to send announcement to channel '
+                          f'{channel.id} in guild {guild.id}:',
+                          exc_info=result)
+
+    def __get_text_channel_ids(self, guild):
+        channel_ids = self._text_channel_ids.get(guild.id)
+        if channel_ids is None:
+            channel_ids = frozenset(ch.id for ch in guild.channels
+                                    if isinstance(ch, discord.TextChannel))
+            self._text_channel_ids[guild.id] = channel_ids
+        return channel_ids
 
 
 def setup(bot):
@@ -1,5 +1,6 @@
 import asyncio
 import discord
+import functools
 import logging
 from . import approvers, rejectors
 from .context import ValidationContext
@@ -17,6 +18,7 @@ PURGE_DM = ("You have been kicked from {} due to not being verified within "
             "sufficient time.  If you feel this is in error, please contact a "
             "mod regarding this.")
 BATCH_SIZE = 10
+PROPAGATE_PROGRESS_INTERVAL = 100
 MINIMUM_GUILD_SIZE = 150
 
 APPROVE_REACTION = '\u2705'
@@ -25,10 +27,23 @@ BAN_REACTION = '\u2620'
 MODLOG_REACTIONS = (APPROVE_REACTION, KICK_REACTION, BAN_REACTION)
 
 
+@functools.lru_cache(maxsize=None)
 def load_list(name):
     return hourai_config.load_list(hourai_config.get_config(), name)
 
 
+async def iterate_members(guild):
+    """Iterates over all of the members of a guild. Uses the in-memory member
+    cache if it is complete, otherwise falls back to fetching them over HTTP.
+    """
+    if guild.chunked:
+        for member in guild.members:
+            yield member
+    else:
+        async for member in guild.fetch_members(limit=None):
+            yield member
+
+
 # TODO(james7132): Add per-server validation configuration.
 # TODO(james7132): Add filter for pornographic or violent avatars
 # Validators are applied in order from first to last. If a later validator has
@@ -165,40 +180,42 @@ class Validation(cogs.BaseCog):
         role = guild.validation_role
         if role is None or not guild.me.guild_permissions.kick_members:
             return
+        role_id = role.id
 
         def _is_kickable(member):
             is_new = member.joined_at is not None and \
                      member.joined_at >= cutoff_time
-            checks = (role in member.roles,                 # Is verified
+            checks = (member._roles.has(role_id),           # Is verified
                       is_new,                               # Is too new
                       member.bot,                           # Is a bot
                       member.premium_since is not None)     # Is a booster
             return not any(checks)
 
+        semaphore = asyncio.Semaphore(BATCH_SIZE)
+
         async def _kick_member(member):
-            try:
-                await utils.send_dm(member, PURGE_DM.format(member.guild.name))
-                await member.kick(reason='Unverified in sufficient time.')
-            except discord.Forbidden:
-                pass
-            mem = utils.pretty_print(member)
-            gld = utils.pretty_print(member.guild)
-            log.info(
-                f'Purged {mem} from {gld} for not being verified in time.')
+            async with semaphore:
+                try:
+                    await utils.send_dm(member,
+                                        PURGE_DM.format(member.guild.name))
+                    await member.kick(reason='Unverified in sufficient time.')
+                except discord.Forbidden:
+                    pass
+            if log.isEnabledFor(logging.INFO):
+                mem = utils.pretty_print(member)
+                gld = utils.pretty_print(member.guild)
+                log.info(
+                    f'Purged {mem} from {gld} for not being verified in time.')
 
         count = 0
         tasks = []
-        async for member in guild.fetch_members(limit=None):
+        async for member in iterate_members(guild):
             if not _is_kickable(member):
                 continue
             count += 1
             if not dry_run:
-                tasks.append(_kick_member(member))
-            if len(tasks) > 5:
-                await asyncio.gather(*tasks)
-                tasks.clear()
-        if len(tasks) > 0:
-            await asyncio.gather(*tasks)
+                tasks.append(asyncio.create_task(_kick_member(member)))
+        await asyncio.gather(*tasks)
 
         return count
 
@@ -339,19 +356,23 @@ class Validation(cogs.BaseCog):
             await ctx.guild.flush_config()
             return
 
+        if role >= ctx.guild.me.top_role:
+            await ctx.send('Verification role is not below the bot\'s highest '
+                           'role. Cannot add it to members.')
+            return
+
         msg = await ctx.send('Propagating validation role...!')
-        last_update = float('-inf')
-        total_processed = 0
         updated = 0
-        async for member in ctx.guild.fetch_members(limit=None):
-            total_processed += 1
-            if role not in member.roles:
-                await member.add_roles(role)
-                updated += 1
-            if updated > last_update + 10:
+        # Role edits on a guild share a single rate limit bucket, so adding
+        # them concurrently gains nothing. Stop at the first failure.
+        async for member in iterate_members(ctx.guild):
+            if member._roles.has(role.id):
+                continue
+            await member.add_roles(role, reason='Validation role propagation')
+            updated += 1
+            if updated % PROPAGATE_PROGRESS_INTERVAL == 0:
                 await msg.edit(
-                    content=f'Propagation Ongoing ({total_processed} done)...')
-                last_update = updated
+                    content=f'Propagation Ongoing ({updated} done)...')
         await msg.edit(content='Propagation conplete!')
 
     @commands.Cog.listener()
@@ -380,6 +401,33 @@ class Validation(cogs.BaseCog):
         except (AttributeError, discord.errors.Forbidden):
             pass
 
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.__invalidate_owner_indexes()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.__invalidate_owner_indexes()
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, before, after):
+        self.__invalidate_owner_indexes()
+
+    def __invalidate_owner_indexes(self):
+        for validator in VALIDATORS:
+            if isinstance(validator, approvers.DistinguishedUserApprover):
+                validator.invalidate_owner_index()
+
+    @commands.Cog.listener()
+    async def on_member_ban(self, guild, user):
+        self.bot.storage.bans.invalidate_guild_bans(
+            guild.id, loop=self.bot.loop)
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild, user):
+        self.bot.storage.bans.invalidate_guild_bans(
+            guild.id, loop=self.bot.loop)
+
     async def get_message(self, payload):
         guild = self.bot.get_guild(payload.guild_id)
         if guild is None or \
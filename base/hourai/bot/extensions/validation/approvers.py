@@ -1,8 +1,8 @@
-from .common import Validator
+from .common import Approver
 from hourai import utils
 
 
-class NitroApprover(Validator):
+class NitroApprover(Approver):
     """A suspicion level validator that approves users that have Nitro.
 
     Note: there is currently no way to confirm if a user has Nitro or not
@@ -23,7 +23,7 @@ class NitroApprover(Validator):
                                     'Probably not a user bot.')
 
 
-class BotApprover(Validator):
+class BotApprover(Approver):
     """A override level validator that approves other bots."""
 
     async def validate_member(self, ctx):
@@ -32,7 +32,7 @@ class BotApprover(Validator):
                 'User is an OAuth2 bot that can only be manually added.')
 
 
-class BotOwnerApprover(Validator):
+class BotOwnerApprover(Approver):
     """An override level validator that approves the owner of the bot or part of
     the team that owns the bot."""
 
@@ -41,7 +41,7 @@ class BotOwnerApprover(Validator):
             ctx.add_approval_reason("User owns this bot.")
 
 
-class DistinguishedUserApprover(Validator):
+class DistinguishedUserApprover(Approver):
     """A malice level approver that approves distinguished users. Approves the
     following:
     - Discord Staff
@@ -63,6 +63,14 @@ class DistinguishedUserApprover(Validator):
         "VERIFIED": 'User is owner of verfied server: "{}"'
     }
 
+    def __init__(self):
+        # Mapping of owner IDs to the IDs of guilds they own. Rebuilt lazily
+        # after being invalidated by guild join, remove and update events.
+        self._owner_index = None
+
+    def invalidate_owner_index(self):
+        self._owner_index = None
+
     async def validate_member(self, ctx):
         self.__validate_via_user_flags(ctx)
         self.__validate_via_server_ownership(ctx)
@@ -74,10 +82,29 @@ class DistinguishedUserApprover(Validator):
                 ctx.add_approval_reason(reason)
 
     def __validate_via_server_ownership(self, ctx):
-        # FIXME: This will not scale to multiple processes/nodes
-        owned_guilds = [guild for guild in ctx.bot.guilds
-                        if guild.owner == ctx.member]
-        for guild in owned_guilds:
+        guild_ids = self.__get_owner_index(ctx.bot).get(ctx.member.id, ())
+        for guild_id in guild_ids:
+            # Approvals override rejections, so check the live guild rather
+            # than trusting the index.
+            guild = ctx.bot.get_guild(guild_id)
+            if guild is None or guild.owner_id != ctx.member.id:
+                continue
             for check, reason_template in self.SERVER_SEARCH_MATCHES.items():
                 if check in guild.features:
                     ctx.add_approval_reason(reason_template.format(guild.name))
+
+    def __get_owner_index(self, bot):
+        """Gets a mapping of owner IDs to the IDs of the guilds they own. Only
+        includes guilds with at least one of the features in
+        SERVER_SEARCH_MATCHES.
+        """
+        if self._owner_index is not None:
+            return self._owner_index
+        # FIXME: This will not scale to multiple processes/nodes
+        index = {}
+        for guild in bot.guilds:
+            if any(check in guild.features
+                   for check in self.SERVER_SEARCH_MATCHES):
+                index.setdefault(guild.owner_id, []).append(guild.id)
+        self._owner_index = index
+        return index
@@ -1,22 +1,60 @@
+import functools
 import re
 
 
 class Validator():
-    """Base class for all validators."""
+    """Base class for all validators.
+
+    If short_circuit is set and the validator rejects the user, the rejectors
+    that follow it are skipped until the next approver.
+    """
     __slots__ = ()
+    short_circuit = False
 
     async def validate_member(self, ctx):
         pass
 
 
+class Approver(Validator):
+    """Base class for validators that approve users. Approvals override
+    previous rejections, so short circuiting never skips approvers.
+    """
+    __slots__ = ()
+
+
 def split_camel_case(val):
     return re.sub('([a-z])([A-Z0-9])', '$1 $2', val).split()
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_filters(filters):
+    """Compiles a tuple of filters into a single case-insensitive regex. Each
+    filter is captured in its own named group, so the index of the filter that
+    matched can be recovered via match_filter_index. Returns None if there are
+    no filters.
+
+    Results are cached, so recompiling an unchanged set of filters is cheap.
+    """
+    if not filters:
+        return None
+    pattern = '|'.join(f'(?P<f{idx}>{generalize_filter(f)})'
+                       for idx, f in enumerate(filters))
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def match_filter_index(match):
+    """Gets the index of the filter that a compile_filters match hit."""
+    return int(match.lastgroup[1:])
+
+
+@functools.lru_cache(maxsize=8192)
 def generalize_filter(filter_value):
+    """Converts a filter into a regex that also matches repeated characters.
+    The result does not handle case itself and must be compiled with
+    re.IGNORECASE.
+    """
     filter_value = re.escape(filter_value)
 
     def _generalize_character(char):
         return char + '+' if char.isalnum() else char
-    generalized = (_generalize_character(char) for char in filter_value)
-    return '(?i)' + ''.join(generalized)
+    return ''.join(_generalize_character(char) for char in filter_value)
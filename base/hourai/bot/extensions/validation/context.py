@@ -2,13 +2,20 @@ import discord
 import logging
 import collections
 from datetime import datetime
+from sqlalchemy import select
 from hourai import utils
 from hourai.utils import embed, format
+from hourai.utils.ttl_cache import TTLCache
 from hourai.db import models
+from .common import Approver
 
 log = logging.getLogger('hourai.validation')
 Username = collections.namedtuple('Username', 'name discriminator timestamp')
 
+# Recently queried username histories, keyed by user ID. Users that fail
+# validation often rejoin shortly after, particularly during spam waves.
+USERNAME_HISTORY_CACHE = TTLCache(maxsize=4096, ttl=300)
+
 
 class ValidationContext:
 
@@ -17,12 +24,14 @@ class ValidationContext:
 
         self.bot = bot
         self.member = member
+        self.guild_config = guild_config
 
         self.approved = True
         self.approval_reasons = []
         self.rejection_reasons = []
 
         self._usernames = None
+        self._whois_embed = None
 
     @property
     def guild(self):
@@ -30,7 +39,7 @@ class ValidationContext:
 
     @property
     def config(self):
-        return self.guild.config.validation
+        return self.guild_config
 
     @property
     def role(self):
@@ -45,17 +54,23 @@ class ValidationContext:
                     name=self.member.name,
                     discriminator=self.member.discriminator,
                     timestamp=datetime.utcnow()))
-            with self.bot.create_storage_session() as session:
-                usernames = session.query(models.Username) \
-                                   .filter_by(user_id=self.member.id) \
-                                   .all()
-                names.update([Username(name=u.name,
-                                       discriminator=u.discriminator,
-                                       timestamp=u.timestamp)
-                              for u in usernames])
+            names.update(self._get_username_history())
             self._usernames = names
         return self._usernames
 
+    def _get_username_history(self):
+        history = USERNAME_HISTORY_CACHE.get(self.member.id)
+        if history is not None:
+            return history
+        with self.bot.create_storage_session() as session:
+            query = select([models.Username.name,
+                            models.Username.discriminator,
+                            models.Username.timestamp]) \
+                .where(models.Username.user_id == self.member.id)
+            history = tuple(Username(*row) for row in session.execute(query))
+        USERNAME_HISTORY_CACHE.set(self.member.id, history)
+        return history
+
     def add_approval_reason(self, reason):
         assert reason is not None
         if reason not in self.approval_reasons:
@@ -89,16 +104,28 @@ class ValidationContext:
                     f' permissions to give them the role')
 
     async def validate_member(self, validators):
+        skipping = False
         for validator in validators:
+            if isinstance(validator, Approver):
+                skipping = False
+            elif skipping:
+                continue
+            rejection_count = len(self.rejection_reasons)
             try:
                 await validator.validate_member(self)
             except Exception as error:
                 # TODO(james7132) Handle the error
                 self.bot.dispatch('log_error', 'Validation', error)
+                continue
+            if validator.short_circuit and \
+               len(self.rejection_reasons) > rejection_count:
+                skipping = True
         return self.approved
 
     async def send_modlog_message(self):
         """Sends verification log to a the guild's modlog."""
+        if not self.guild.config.logging.HasField('modlog_channel_id'):
+            return None
         mention = None
         # Only ping a mod if enabled and failed approval
         if self.config.ping_moderator_on_fail and not self.approved:
@@ -147,8 +174,17 @@ class ValidationContext:
                 f"```{format.bullet_list(self.rejection_reasons)}```"
             ]
 
-        ctx = await self.bot.get_automated_context(content='', author=member)
-        async with ctx:
-            return await messageable.send(
-                content="\n".join(message),
-                embed=embed.make_whois_embed(ctx, member))
+        return await messageable.send(content="\n".join(message),
+                                      embed=await self.get_whois_embed())
+
+    async def get_whois_embed(self):
+        """|coro| Gets a whois embed for the member being validated. The
+        embed is built once per context, and a fresh copy is returned on each
+        call.
+        """
+        if self._whois_embed is None:
+            ctx = await self.bot.get_automated_context(content='',
+                                                       author=self.member)
+            async with ctx:
+                self._whois_embed = embed.make_whois_embed(ctx, self.member)
+        return self._whois_embed.copy()
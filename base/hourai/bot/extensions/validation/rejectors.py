@@ -1,14 +1,23 @@
+import discord
 import humanize
 import re
+import time
 from unidecode import unidecode
-from datetime import datetime
+from sqlalchemy import select
 from hourai import utils
 from hourai.db import models
-from .common import Validator, generalize_filter, split_camel_case
+from hourai.utils import iterable
+from hourai.utils.ttl_cache import TTLCache
+from .common import Validator, split_camel_case, compile_filters, \
+    match_filter_index
 
 
-LOOSE_DELETED_USERNAME_MATCH = re.compile(r'(?i).*Deleted.*User.*')
+LOOSE_DELETED_USERNAME_MATCH = re.compile(r'.*Deleted.*User.*',
+                                          re.IGNORECASE)
 TRANSFORMS = (lambda x: x, unidecode)
+NAME_MATCH_CACHE_TTL = 60
+NAME_MATCH_CHUNK_SIZE = 100
+BANNED_USERNAME_CACHE_TTL = 300
 
 
 class NameMatchRejector(Validator):
@@ -16,7 +25,7 @@ class NameMatchRejector(Validator):
     other users already on the server.
     """
     __slots__ = ("filter", "prefix", "subfield", "member_selector",
-                 "min_match_length")
+                 "min_match_length", "_filter_cache")
 
     def __init__(self, *, prefix, filter_func,
                  min_match_length=None, subfield=None, member_selector=None):
@@ -25,72 +34,109 @@ class NameMatchRejector(Validator):
         self.subfield = subfield or (lambda m: m.name)
         self.member_selector = member_selector or (lambda m: m.name)
         self.min_match_length = min_match_length
+        # The matched members rarely change, so cache their filters per guild.
+        self._filter_cache = TTLCache(maxsize=1024, ttl=NAME_MATCH_CACHE_TTL)
 
     async def validate_member(self, ctx):
-        member_names = {}
-        for guild_member in filter(self.filter, ctx.guild.members):
-            name = self.member_selector(guild_member) or ''
-            member_names.update({
-                p: generalize_filter(p) for p in self._split_name(name)
-            })
         field_value = self.subfield(ctx.member)
-        for filter_name, regex in member_names.items():
-            if re.search(regex, field_value):
-                ctx.add_rejection_reason(
-                    self.prefix + f"Matches: '{filter_name}'")
-
-    def _split_name(self, name):
-        split_name = split_camel_case(name)
-        if self.min_match_length is not None:
-            split_name = (n for n in split_name
-                          if len(n) >= self.min_match_length)
-        return split_name
+        # Every generalized token matches at least as many characters as it
+        # has, so fields shorter than the minimum cannot match anything.
+        if not field_value or len(field_value) < (self.min_match_length or 0):
+            return
+        for tokens, regex in self._get_filters(ctx.guild):
+            for match in regex.finditer(field_value):
+                token = tokens[match_filter_index(match)]
+                ctx.add_rejection_reason(self.prefix + f"Matches: '{token}'")
+
+    def _get_filters(self, guild):
+        filters = self._filter_cache.get(guild.id)
+        if filters is not None:
+            return filters
+        names = set(self.member_selector(guild_member)
+                    for guild_member in guild.members
+                    if self.filter(guild_member))
+        names.discard(None)
+        # Tokens are deduplicated exactly. Case folding them here would not
+        # agree with re.IGNORECASE, which only does simple case folding, and
+        # would drop tokens that match different names, i.e. "Straße".
+        min_length = self.min_match_length or 0
+        unique_tokens = {token
+                         for name in names
+                         for token in split_camel_case(name)
+                         if len(token) >= min_length}
+        # Merge the tokens into a few large alternations so the field is
+        # only scanned once per chunk rather than once per token. Tokens are
+        # sorted longest first so the most specific token wins a match, and
+        # deterministically so unchanged chunks hit the compile_filters cache
+        # on refresh.
+        tokens = sorted(unique_tokens, key=lambda t: (-len(t), t))
+        chunks = (tuple(chunk) for chunk in
+                  iterable.chunked(tokens, NAME_MATCH_CHUNK_SIZE))
+        filters = tuple((chunk, compile_filters(chunk)) for chunk in chunks)
+        self._filter_cache.set(guild.id, filters)
+        return filters
 
 
 class StringFilterRejector(Validator):
     """A general validator that rejects users that have a field that matches
     a set of predefined list of regexes.
     """
-    __slots__ = ("filters", "prefix", "match_func", "subfield",
-                 "use_transforms")
+    __slots__ = ("filters", "regex", "full_match", "prefix", "subfield",
+                 "transforms")
 
     def __init__(self, *, prefix, filters, full_match=False, subfield=None,
                  use_transforms=True):
         self.prefix = prefix or ''
-        self.filters = [(f, re.compile(generalize_filter(f))) for f in filters]
-        self.use_transforms = use_transforms
+        # The combined regex only reports one filter per match position.
+        # Longer filters are tried first so the most specific one is
+        # reported, i.e. "f499" rather than "f4".
+        self.filters = tuple(sorted(filters, key=len, reverse=True))
+        self.regex = compile_filters(self.filters)
+        self.full_match = full_match
+        self.transforms = TRANSFORMS if use_transforms else TRANSFORMS[:1]
         self.subfield = subfield or (
             lambda ctx: (u.name for u in ctx.usernames))
-        if full_match:
-            self.match_func = lambda r: r.match
-        else:
-            self.match_func = lambda r: r.search
 
     async def validate_member(self, ctx):
-        transforms = TRANSFORMS if self.use_transforms else (lambda x: x,)
-        for field_value in self.subfield(ctx):
-            for filter_name, regex in self.filters:
-                for transform in transforms:
-                    transformed = transform(field_value)
-                    if self.match_func(regex)(transformed):
-                        ctx.add_rejection_reason(
-                            self.prefix + f'Matches: `{filter_name}`')
+        if self.regex is None:
+            return
+        fields = list(self.subfield(ctx))
+        if not fields:
+            return
+        for field_value in fields:
+            for transform in self.transforms:
+                for match in self._find_matches(transform(field_value)):
+                    filter_name = self.filters[match_filter_index(match)]
+                    ctx.add_rejection_reason(
+                        self.prefix + f'Matches: `{filter_name}`')
+
+    def _find_matches(self, value):
+        if not self.full_match:
+            return self.regex.finditer(value)
+        match = self.regex.fullmatch(value)
+        return () if match is None else (match,)
 
 
 class NewAccountRejector(Validator):
     """A suspicion level validator that rejects users that were recently
     created.
     """
-    __slots__ = ("lookback")
+    __slots__ = ("lookback", "lookback_ms", "reason")
 
     def __init__(self, *, lookback):
         self.lookback = lookback
+        self.lookback_ms = lookback.total_seconds() * 1000
+        # The lookback is fixed for the validator's lifetime, so the
+        # rejection reason only needs to be formatted once.
+        self.reason = ("Account created less than "
+                       f"{humanize.naturaltime(lookback)}")
 
     async def validate_member(self, ctx):
-        if ctx.member.created_at > datetime.utcnow() - self.lookback:
-            lookback_naturalized = humanize.naturaltime(self.lookback)
-            ctx.add_rejection_reason(
-                f"Account created less than {lookback_naturalized}")
+        # Compare against the creation time embedded in the user's snowflake
+        # ID directly rather than building datetimes on every join.
+        created_at_ms = (ctx.member.id >> 22) + discord.utils.DISCORD_EPOCH
+        if created_at_ms > time.time() * 1000 - self.lookback_ms:
+            ctx.add_rejection_reason(self.reason)
 
 
 class DeletedAccountRejector(Validator):
@@ -133,22 +179,28 @@ class NoAvatarRejector(Validator):
 
 class BannedUserRejector(Validator):
     """A malice level validator that rejects users that are banned on other
-    servers.
+    servers. Short circuits as it makes the remaining malice level checks
+    redundant.
     """
     __slots__ = ("min_guild_size")
+    short_circuit = True
 
     def __init__(self, *, min_guild_size):
         self.min_guild_size = min_guild_size
 
     async def validate_member(self, ctx):
         bans = ctx.bot.storage.bans.get_user_bans(ctx.member.id)
-        valid_bans = list(filter(self._is_valid_ban, bans))
-        if len(valid_bans) <= 0:
+        ban_count = 0
+        reasons = set()
+        for ban in filter(self._is_valid_ban, bans):
+            ban_count += 1
+            if ban.HasField('reason'):
+                reasons.add(ban.reason)
+        if ban_count == 0:
             return
-        reasons = set(b.reason for b in valid_bans if b.HasField('reason'))
-        reason = f"Banned from {len(bans)} servers " if len(bans) > 1 else \
+        reason = f"Banned from {ban_count} servers " if ban_count > 1 else \
                  "Banned from another server "
-        if len(reasons) > 0:
+        if reasons:
             reason += "for the following reasons:\n"
             reason += "\n    - ".join(reasons)
         ctx.add_rejection_reason(reason)
@@ -163,7 +215,12 @@ class BannedUsernameRejector(Validator):
      - Exact username matches (ignoring repeated whitespace and casing).
      - Exact avatar matches.
     """
-    __slots__ = ()
+    __slots__ = ("_username_index",)
+
+    def __init__(self):
+        # Normalized banned usernames, one lookup table per transform.
+        self._username_index = TTLCache(maxsize=1024,
+                                        ttl=BANNED_USERNAME_CACHE_TTL)
 
     async def validate_member(self, ctx):
         if not ctx.guild.me.guild_permissions.ban_members:
@@ -188,36 +245,53 @@ class BannedUsernameRejector(Validator):
             ctx.add_rejection_reason(reason)
 
     def __check_usernames(self, ctx, bans):
-        ban_ids = [ban.user_id for ban in bans]
+        if not bans:
+            return
+        for transform, index in zip(TRANSFORMS,
+                                    self.__get_username_index(ctx, bans)):
+            normalized_usernames = set(self._normalize(transform(u.name))
+                                       for u in ctx.usernames)
+            # Don't match on empty string matches
+            normalized_usernames.discard("")
+
+            for normalized in normalized_usernames:
+                banned = index.get(normalized)
+                if banned is None:
+                    continue
+                name, user_id, ban_reason = banned
+                reason = (f"Exact username match with banned user: "
+                          f"{name} ({user_id}).")
+                if ban_reason is not None:
+                    reason += f" Ban Reason: {ban_reason}"
+                ctx.add_rejection_reason(reason)
+                break
+
+    def __get_username_index(self, ctx, bans):
+        # BanStorage returns the same tuple until the guild's bans change or
+        # are invalidated by a ban event, so the index is rebuilt only then.
+        cached = self._username_index.get(ctx.guild.id)
+        if cached is not None and cached[0] is bans:
+            return cached[1]
         ban_reasons = {ban.user_id:
                        ban.reason if ban.HasField('reason') else None
                        for ban in bans}
         with ctx.bot.create_storage_session() as session:
-            matches = session.query(models.Username) \
-                             .filter(models.Username.user_id.in_(ban_ids)) \
-                             .distinct(models.Username.name)
-
-            for transform in TRANSFORMS:
-                normalized_usernames = set(self._normalize(transform(u.name))
-                                           for u in ctx.usernames)
-                # Don't match on empty string matches
-                normalized_usernames.discard("")
-
-                for banned_username in matches.all():
-                    transformed = transform(banned_username.name)
-                    normalized = self._normalize(transformed)
-                    if normalized not in normalized_usernames:
-                        continue
-                    ban_reason = ban_reasons.get(banned_username.user_id)
-                    reason = (f"Exact username match with banned user: "
-                              f"{banned_username.name} "
-                              f"({banned_username.user_id}).")
-                    if ban_reason is not None:
-                        reason += f" Ban Reason: {ban_reason}"
-                    ctx.add_rejection_reason(reason)
-                    break
-
-    def _normalize(self, val):
+            query = select([models.Username.user_id, models.Username.name]) \
+                .where(models.Username.user_id.in_(list(ban_reasons))) \
+                .distinct(models.Username.name)
+            banned_usernames = session.execute(query).fetchall()
+        index = tuple({} for _ in TRANSFORMS)
+        for user_id, name in banned_usernames:
+            banned = (name, user_id, ban_reasons.get(user_id))
+            for transform, names in zip(TRANSFORMS, index):
+                names.setdefault(self._normalize(transform(name)), banned)
+        self._username_index.set(ctx.guild.id, (bans, index))
+        return index
+
+    @staticmethod
+    def _normalize(val):
+        # str.split() collapses whitespace runs and trims in a single C-level
+        # pass. It measures several times faster than an equivalent re.sub.
         return " ".join(val.casefold().split())
 
 
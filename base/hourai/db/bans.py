@@ -1,23 +1,50 @@
 import logging
+from sqlalchemy import func
+from hourai.utils.ttl_cache import TTLCache
 from . import proto, models
 
 
 log = logging.getLogger(__name__)
 
+# Bans are written by the logger, so a ban event may arrive before its row
+# does. Ban events invalidate the cache both immediately and again after
+# BAN_INVALIDATION_DELAY, and the short TTL bounds a slow logger write.
+GUILD_BAN_CACHE_TTL = 30
+BAN_INVALIDATION_DELAY = 5
+
 
 class BanStorage:
     """An interface for access store all of the bans seen by the bot."""
 
     def __init__(self, storage):
         self.storage = storage
+        self._guild_bans = TTLCache(maxsize=4096, ttl=GUILD_BAN_CACHE_TTL)
 
     def get_guild_bans(self, guild_id):
+        bans = self._guild_bans.get(guild_id)
+        if bans is not None:
+            return bans
         session = self.storage.create_session()
         with session:
             bans = session.query(models.Ban) \
                           .filter_by(guild_id=guild_id) \
                           .all()
-            return list(self._make_ban_protos(bans, session))
+            bans = tuple(self._make_ban_protos(bans, session))
+        self._guild_bans.set(guild_id, bans)
+        return bans
+
+    def invalidate_guild_bans(self, guild_id, loop=None):
+        """Drops the cached bans for a guild. Should be called whenever a user
+        is banned or unbanned from it.
+
+        If a loop is provided, the cache is invalidated again after
+        BAN_INVALIDATION_DELAY, so bans read before the logger has written
+        the new ban are not kept for the full TTL.
+        """
+        self._guild_bans.pop(guild_id)
+        if loop is not None:
+            loop.call_later(BAN_INVALIDATION_DELAY,
+                            self._guild_bans.pop, guild_id)
 
     def get_user_bans(self, user_id):
         session = self.storage.create_session()
@@ -33,15 +60,17 @@ class BanStorage:
                          .filter(models.AdminConfig.id.in_(guild_ids)) \
                          .all()
         configs = {cfg.id: cfg for cfg in configs}
+        guild_sizes = session.query(models.Member.guild_id, func.count()) \
+                             .filter(models.Member.guild_id.in_(guild_ids)) \
+                             .group_by(models.Member.guild_id) \
+                             .all()
+        guild_sizes = dict(guild_sizes)
         for ban in bans:
             config = configs.get(ban.guild_id)
             ban_proto = proto.BanInfo()
             ban_proto.guild_id = ban.guild_id
             ban_proto.user_id = ban.user_id
-            ban_proto.guild_size = \
-                session.query(models.Member) \
-                       .filter_by(guild_id=ban.guild_id) \
-                       .count()
+            ban_proto.guild_size = guild_sizes.get(ban.guild_id, 0)
             if ban.reason is not None:
                 ban_proto.reason = ban.reason
             if config is not None:
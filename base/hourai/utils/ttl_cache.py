@@ -0,0 +1,54 @@
+import collections
+import time
+import typing
+
+
+class TTLCache:
+    """A size bounded LRU cache where entries expire a fixed amount of time
+    after being set. Not thread-safe.
+    """
+    __slots__ = ("_entries", "_maxsize", "_ttl")
+
+    def __init__(self, *, maxsize, ttl):
+        self._entries = collections.OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: typing.Any, default: typing.Any = None) -> typing.Any:
+        """Gets a value from the cache. Returns default if the key is not
+        present or has expired.
+        """
+        try:
+            expiration, value = self._entries[key]
+        except KeyError:
+            return default
+        if expiration <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: typing.Any, value: typing.Any) -> None:
+        """Sets a value in the cache, evicting the least recently used entries
+        if the cache is full.
+        """
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: typing.Any, default: typing.Any = None) -> typing.Any:
+        """Removes a value from the cache, returning it if it has not
+        expired.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def clear(self) -> None:
+        """Removes all values from the cache."""
+        self._entries.clear()